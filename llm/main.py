@@ -1,22 +1,40 @@
 import os
-import json
-import requests
-from typing import Dict, Any, List, Optional
+import re
+import bisect
+import asyncio
+import functools
+import importlib
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Optional, Tuple
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
-from langchain.llms.base import LLM
-from langchain_core.prompts import PromptTemplate
-from langchain.callbacks.manager import CallbackManagerForLLMRun
 
-# Environment configuration
-CHAIR_API_KEY = os.getenv("CHAIR_API_KEY")
-API_URL = "https://gpu.aet.cit.tum.de/api/chat/completions"
+if TYPE_CHECKING:
+    from open_webui_llm import OpenWebUILLM
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the recommendation batcher on startup; stop it and close the LLM client,
+    if the LLM was ever loaded, on shutdown.
+    """
+    recommendation_batcher.start()
+    try:
+        yield
+    finally:
+        await recommendation_batcher.stop()
+        if _llm is not None:
+            await _llm.aclose()
+
 
 # Create FastAPI application instance
 app = FastAPI(
     title="LLM Recommendation Service",
     description="Service that generates personalized food recommendations using an LLM",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -42,129 +60,429 @@ class RecommendResponse(BaseModel):
     recommendation: str = Field(..., description="Personalized food recommendation")
 
 
-class OpenWebUILLM(LLM):
+class HealthResponse(BaseModel):
     """
-    Custom LangChain LLM wrapper for Open WebUI API.
-    
-    This class integrates the Open WebUI API with LangChain's LLM interface,
-    allowing us to use the API in LangChain chains and pipelines.
+    Response schema for health check endpoint.
+
+    Attributes:
+        status (str): Health status of the service.
+        service (str): Name of the service.
     """
-    
-    api_url: str = API_URL
-    api_key: str = CHAIR_API_KEY
-    model_name: str = "llama3.3:latest"
-    
-    @property
-    def _llm_type(self) -> str:
-        return "open_webui"
-    
-    def _call(
-        self,
-        prompt: str,
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
-        **kwargs: Any,
-    ) -> str:
+    status: str = Field(..., description="Health status of the service")
+    service: str = Field(..., description="Name of the service")
+
+
+class ServiceInfoResponse(BaseModel):
+    """
+    Response schema for root endpoint.
+
+    Attributes:
+        service (str): Name of the service.
+        version (str): Service version.
+        description (str): Short description of the service.
+        endpoints (Dict[str, str]): Available endpoints by name.
+    """
+    service: str = Field(..., description="Name of the service")
+    version: str = Field(..., description="Service version")
+    description: str = Field(..., description="Short description of the service")
+    endpoints: Dict[str, str] = Field(..., description="Available endpoints by name")
+
+
+# The LLM is created by the first request that needs it, not at startup; importing it
+# pulls in LangChain, which would otherwise dominate startup time even when every
+# request is answered from the fast path or the cache
+_llm: Optional["OpenWebUILLM"] = None
+
+
+async def _get_llm() -> "OpenWebUILLM":
+    """
+    Return the shared LLM, importing LangChain on first use.
+
+    The import runs in a worker thread so it does not block the event loop, and
+    with it /health and every other in-flight request.
+    """
+    global _llm
+    if _llm is None:
+        module = await asyncio.to_thread(importlib.import_module, "open_webui_llm")
+        if _llm is None:
+            _llm = module.OpenWebUILLM()
+    return _llm
+
+
+# Static instructions go first as a system message so every request shares the same
+# long prefix, which lets the backend reuse its prompt cache. Keep these strings
+# byte-for-byte stable: no timestamps or per-request data. The variable menu data
+# is only sent in the user message, built by a single concatenation per request.
+STATIC_INSTRUCTIONS = """You are a helpful food recommendation assistant. Your task is to suggest exactly one dish from today's menu based on the user's preferences.
+
+The user message lists the user's favorite meals and today's available meals. Based on the user's favorite meals, please recommend exactly ONE meal from today's available options.
+Consider:
+- Similarity to the user's favorite meals
+- Flavor profiles that match their preferences
+- Availability in today's menu
+
+IMPORTANT: You must respond with ONLY the exact name of one dish from today's menu. Do not include any explanations, additional text, punctuation, or formatting. Just return the dish name exactly as it appears in today's menu.
+
+Example format: Spaghetti Carbonara"""
+_PROMPT_PREFIX = "User's favorite meals: "
+_PROMPT_MID = "\n\nToday's available meals: "
+_PROMPT_SUFFIX = "\n\nRecommendation:"
+
+# Instructions used when several concurrent requests are answered by a single LLM call
+BATCH_INSTRUCTIONS = """You are a helpful food recommendation assistant. The user message lists several numbered users. For each of them, suggest exactly one dish from that user's available meals based on their favorite meals.
+
+IMPORTANT: You must respond with exactly one line per user, in the order the users are listed. Line i must contain ONLY the exact name of the dish recommended for user i, exactly as it appears in that user's available meals. Do not include numbering, explanations, additional text, punctuation, or formatting."""
+_BATCH_PROMPT_MID = "\n\nRespond with exactly "
+_BATCH_PROMPT_SUFFIX = " lines.\n\nRecommendations:"
+
+
+@functools.lru_cache(maxsize=1024)
+def build_prompt(favorite_meals_str: str, todays_meals_str: str) -> str:
+    """
+    Build the user message for a single recommendation; pair with ``STATIC_INSTRUCTIONS``.
+
+    Memoized because the same menu strings repeat across users of a canteen.
+    """
+    return f"{_PROMPT_PREFIX}{favorite_meals_str}{_PROMPT_MID}{todays_meals_str}{_PROMPT_SUFFIX}"
+
+
+def build_batch_prompt(pairs: List[Tuple[str, str]]) -> str:
+    """Build the numbered user message for a batch; pair with ``BATCH_INSTRUCTIONS``."""
+    users = "\n\n".join(
+        f"User {i}:\nFavorite meals: {favorite_meals_str}\nToday's available meals: {todays_meals_str}"
+        for i, (favorite_meals_str, todays_meals_str) in enumerate(pairs, start=1)
+    )
+    return f"{users}{_BATCH_PROMPT_MID}{len(pairs)}{_BATCH_PROMPT_SUFFIX}"
+
+
+# Numbering the model may prepend to a line despite the instructions, e.g. "2. " or
+# "User 2: ". Only stripped when the number is the line's own index and is followed by
+# whitespace, so dish names such as "3-Käse-Pizza" are left alone.
+_BATCH_LINE_PREFIX = re.compile(r"^(?:user\s*)?(\d+)\s*[.):-]\s+", re.IGNORECASE)
+
+
+def _match_batch_line(line: str, index: int, todays_menu: List[str]) -> Optional[str]:
+    """
+    Match one line of a batched answer against that user's menu.
+
+    The raw line is tried first; the numbering is only stripped if that fails.
+
+    Args:
+        line: Stripped line from the batched LLM answer
+        index: 1-based position of the line, i.e. the user it should answer
+        todays_menu: That user's available meal names
+
+    Returns:
+        The meal name as it appears in the user's menu, or None if the line
+        does not name one of their dishes
+    """
+    match = _find_menu_item(line, todays_menu)
+    if match is None:
+        prefix = _BATCH_LINE_PREFIX.match(line)
+        if prefix is not None and int(prefix.group(1)) == index:
+            match = _find_menu_item(line[prefix.end():], todays_menu)
+    return match
+
+
+class RecommendationBatcher:
+    """
+    Micro-batches concurrent recommendation requests into one LLM call.
+
+    Requests are sorted into size bins (small, medium, large) using the number of
+    favorite and available meals as a cheap proxy for prompt length, so short
+    prompts are not batched with, and padded to, very long ones. Each bin is
+    collected independently until either ``max_batch`` requests are pending or
+    ``max_wait_ms`` have passed since the first one arrived. A batch is sent as
+    one numbered multi-user prompt and the answer is split back into one line per
+    request. If the answer cannot be matched to the batch, each request falls
+    back to its own single-prompt call.
+    """
+
+    # Upper size bounds of the small and medium bins; anything larger is "large"
+    size_bins: Tuple[int, ...] = (5, 20)
+
+    def __init__(self, max_batch: int = 16, max_wait_ms: int = 25):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._dispatches: set = set()
+
+    def start(self) -> None:
+        """Start collecting requests for every size bin on the running event loop."""
+        self._queues = [asyncio.Queue() for _ in range(len(self.size_bins) + 1)]
+        self._workers = [asyncio.create_task(self._collect(queue)) for queue in self._queues]
+
+    async def stop(self) -> None:
         """
-        Call the Open WebUI API to generate a response.
-        
+        Stop collecting requests and wait for in-flight batches to finish.
+
+        Requests that are still queued or being collected are dispatched right away
+        rather than dropped, so no caller of ``submit`` is left waiting.
+        """
+        queues, self._queues = self._queues, []
+        for queue in queues:
+            # Sentinel behind the last queued request; submit no longer sees the queues
+            queue.put_nowait(None)
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    async def submit(self, favorite_menu: List[str], todays_menu: List[str]) -> str:
+        """
+        Queue a request in its size bin and wait for its recommendation.
+
         Args:
-            prompt: The input prompt to send to the model
-            stop: Optional list of stop sequences
-            run_manager: Optional callback manager for LangChain
-            **kwargs: Additional keyword arguments
-            
+            favorite_menu: User's favorite meal names
+            todays_menu: Today's available meal names
+
         Returns:
-            The generated response text
-            
-        Raises:
-            Exception: If API call fails
+            The recommended meal name; answers from a batched call are already
+            matched against ``todays_menu``
         """
-        if not self.api_key:
-            raise ValueError("CHAIR_API_KEY environment variable is required")
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        
-        # Build messages for chat completion
-        messages = [
-            {"role": "user", "content": prompt}
+        if not self._queues:
+            raise RuntimeError("Recommendation batcher is not running; start the app lifespan first")
+
+        # Format arrays as comma-separated strings for better processing; sorting makes
+        # the strings independent of input order so memoized prompts are reused
+        favorite_meals_str = ", ".join(sorted(favorite_menu))
+        todays_meals_str = ", ".join(sorted(todays_menu))
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues[bisect.bisect_left(self.size_bins, len(favorite_menu) + len(todays_menu))]
+        await queue.put((favorite_meals_str, todays_meals_str, todays_menu, future))
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue) -> None:
+        """
+        Group one bin's queued requests into batches and dispatch them without waiting for the LLM.
+
+        Returns once it reaches the ``None`` sentinel queued by ``stop``, after
+        dispatching the batch collected so far.
+        """
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            request = await queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, str, List[str], asyncio.Future]]) -> None:
+        """Answer a batch with one LLM call; requests it does not answer get their own call."""
+        fallback = batch
+        if len(batch) > 1:
+            try:
+                recommendations = await self._recommend_batch(batch)
+            except Exception as e:
+                print(f"Batched recommendation failed, falling back to single prompts: {str(e)}")
+                recommendations = None
+
+            if recommendations is not None:
+                fallback = []
+                for request, recommendation in zip(batch, recommendations):
+                    if recommendation is None:
+                        fallback.append(request)
+                    elif not request[3].done():
+                        request[3].set_result(recommendation)
+                if fallback:
+                    print(f"Batched recommendation did not match the menu for {len(fallback)} of {len(batch)} requests, falling back to single prompts")
+
+        await asyncio.gather(*(self._recommend_single(*request) for request in fallback))
+
+    @staticmethod
+    async def _recommend_batch(
+        batch: List[Tuple[str, str, List[str], asyncio.Future]],
+    ) -> Optional[List[Optional[str]]]:
+        """
+        Send one numbered prompt for the whole batch.
+
+        Returns None if the answer does not have one line per request; otherwise
+        the matched meal per request, with None for lines that name no dish on
+        that user's menu.
+        """
+        prompt = build_batch_prompt([(favorite_meals_str, todays_meals_str) for favorite_meals_str, todays_meals_str, _, _ in batch])
+        llm = await _get_llm()
+        response = await llm._acall(prompt, system_prompt=BATCH_INSTRUCTIONS)
+
+        # One non-blank line per user, in batch order
+        lines = [line for line in (raw.strip() for raw in response.splitlines()) if line]
+        if len(lines) != len(batch):
+            print(f"Batched recommendation returned {len(lines)} lines for {len(batch)} requests, falling back to single prompts")
+            return None
+        return [
+            _match_batch_line(line, index, todays_menu)
+            for index, (line, (_, _, todays_menu, _)) in enumerate(zip(lines, batch), start=1)
         ]
-        
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-        }
-        
+
+    @staticmethod
+    async def _recommend_single(
+        favorite_meals_str: str,
+        todays_meals_str: str,
+        todays_menu: List[str],
+        future: asyncio.Future,
+    ) -> None:
+        """Answer one request with the regular single-user prompt."""
         try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            # Extract the response content
-            if "choices" in result and len(result["choices"]) > 0:
-                content = result["choices"][0]["message"]["content"]
-                return content.strip()
-            else:
-                raise ValueError("Unexpected response format from API")
-                
-        except requests.RequestException as e:
-            raise Exception(f"API request failed: {str(e)}")
-        except (KeyError, IndexError, ValueError) as e:
-            raise Exception(f"Failed to parse API response: {str(e)}")
-
-
-# Initialize the LLM
-llm = OpenWebUILLM()
-
-# Create the prompt template
-recommendation_prompt = PromptTemplate(
-    input_variables=["favorite_menu", "todays_menu"],
-    template="""You are a helpful food recommendation assistant. Your task is to suggest exactly one dish from today's menu based on the user's preferences.
-
-User's favorite meals: {favorite_menu}
-
-Today's available meals: {todays_menu}
-
-Based on the user's favorite meals, please recommend exactly ONE meal from today's available options. 
-Consider:
-- Similarity to the user's favorite meals
-- Flavor profiles that match their preferences
-- Availability in today's menu
+            llm = await _get_llm()
+            recommendation = await llm._acall(build_prompt(favorite_meals_str, todays_meals_str), system_prompt=STATIC_INSTRUCTIONS)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(recommendation)
 
-IMPORTANT: You must respond with ONLY the exact name of one dish from today's menu. Do not include any explanations, additional text, punctuation, or formatting. Just return the dish name exactly as it appears in today's menu.
 
-Example format: Spaghetti Carbonara
+recommendation_batcher = RecommendationBatcher(max_batch=16, max_wait_ms=25)
 
-Recommendation:"""
-)
+# Cache of recommendations keyed by the normalized (favorites, today's menu) pair.
+# Today's menu is shared by every user of a canteen, so the same key repeats a lot;
+# entries expire after a few hours because menus change daily. Only accessed from
+# the event loop, so no lock is needed.
+_recommendation_cache: TTLCache = TTLCache(maxsize=4096, ttl=6 * 3600)
+
+# LLM requests in flight per cache key, so concurrent misses for the same menus share
+# one request instead of each asking the LLM before the first answer is cached
+_pending_recommendations: Dict[Tuple[FrozenSet[str], FrozenSet[str]], "asyncio.Task[str]"] = {}
+
+
+def _normalize(meal: str) -> str:
+    """Normalize a meal name for comparisons: surrounding whitespace and case are ignored."""
+    return meal.strip().casefold()
 
-# Create the chain using the new RunnableSequence patternAdd commentMore actions
-recommendation_chain = recommendation_prompt | llm
 
-@app.get("/health")
-async def health_check():
+def _cache_key(meals: List[str]) -> FrozenSet[str]:
+    """Normalize meal names into an order- and case-insensitive cache key."""
+    return frozenset(_normalize(meal) for meal in meals)
+
+
+def _find_menu_item(answer: str, todays_menu: List[str]) -> Optional[str]:
+    """
+    Snap an LLM answer to a dish on today's menu instead of retrying the LLM.
+
+    Tries an exact case-insensitive match first, then the longest dish name
+    contained in the answer, so "Pasta Carbonara." matches "Pasta Carbonara"
+    rather than "Pasta".
+
+    Args:
+        answer: Raw recommendation returned by the LLM
+        todays_menu: Today's available meal names
+
+    Returns:
+        The meal name exactly as it appears in today's menu, or None if the
+        answer names no dish on the menu
+    """
+    menu_by_name = {_normalize(meal): meal for meal in todays_menu}
+    answer = _normalize(answer)
+    exact = menu_by_name.get(answer)
+    if exact is not None:
+        return exact
+
+    contained = [name for name in menu_by_name if name and name in answer]
+    return menu_by_name[max(contained, key=len)] if contained else None
+
+
+@functools.lru_cache(maxsize=10_000)
+def _favorite_set(favorite_menu: Tuple[str, ...]) -> FrozenSet[str]:
+    """Normalized favorites, memoized because users send the same saved list repeatedly."""
+    return frozenset(_normalize(meal) for meal in favorite_menu)
+
+
+def _trivial_recommendation(favorite_menu: List[str], todays_menu: List[str]) -> Optional[str]:
+    """
+    Return a recommendation that needs no LLM call, if there is one.
+
+    That is the case when only one meal is available today, or when one of the
+    user's favorite meals is on today's menu (ignoring case and surrounding whitespace).
+
+    Args:
+        favorite_menu: User's favorite meal names
+        todays_menu: Today's available meal names
+
+    Returns:
+        The recommended meal name, or None if the LLM has to decide
+    """
+    if len(todays_menu) == 1:
+        return todays_menu[0]
+
+    favorites = _favorite_set(tuple(favorite_menu))
+    return next((meal for meal in todays_menu if _normalize(meal) in favorites), None)
+
+
+async def _recommend_cached(favorite_menu: List[str], todays_menu: List[str]) -> str:
+    """
+    Return a recommendation for the given menus, calling the LLM only on a cache miss.
+
+    Concurrent misses for the same key wait for the first one's LLM request.
+
+    Args:
+        favorite_menu: User's favorite meal names
+        todays_menu: Today's available meal names
+
+    Returns:
+        The recommended meal name, as it appears in today's menu
+    """
+    key = (_cache_key(favorite_menu), _cache_key(todays_menu))
+    cached = _recommendation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    pending = _pending_recommendations.get(key)
+    if pending is None:
+        pending = asyncio.create_task(recommendation_batcher.submit(favorite_menu, todays_menu))
+        _pending_recommendations[key] = pending
+        pending.add_done_callback(lambda _: _pending_recommendations.pop(key, None))
+
+    # Shielded so one caller disconnecting does not cancel the request for the others
+    recommendation = await asyncio.shield(pending)
+    match = _find_menu_item(recommendation, todays_menu)
+    if match is None:
+        # Not cached, so the next request asks the LLM again instead of reusing a guess
+        print(f"LLM recommendation {recommendation!r} is not on today's menu, falling back to {todays_menu[0]!r}")
+        return todays_menu[0]
+
+    _recommendation_cache[key] = match
+    return match
+
+
+@app.get("/health", response_model=HealthResponse)
+async def health_check() -> HealthResponse:
     """Health check endpoint."""
-    return {"status": "healthy", "service": "LLM Recommendation Service"}
+    return HealthResponse(status="healthy", service="LLM Recommendation Service")
 
 
 @app.post(
     "/recommend",
     response_model=RecommendResponse,
     summary="Generate personalized food recommendation",
-    description="Accepts user's favorite meals and today's menu, returns a personalized meal recommendation via Ollama."
+    description="Accepts user's favorite meals and today's menu, returns a personalized meal recommendation from today's menu via the Open WebUI LLM API."
 )
 async def recommend(req: RecommendRequest) -> RecommendResponse:
     """
-    Generate a personalized food recommendation using LangChain and Ollama.
+    Generate a personalized food recommendation from today's menu.
+
+    Obvious cases (a single meal today, or a favorite on today's menu) are answered
+    directly. Otherwise the recommendation comes from the cache or, on a miss, from
+    the batcher, which asks the Open WebUI LLM API.
     
     Args:
         req: Request containing user's favorite meals and today's menu
@@ -188,14 +506,11 @@ async def recommend(req: RecommendRequest) -> RecommendResponse:
                 detail="todays_menu cannot be empty"
             )
         
-        # Format arrays as comma-separated strings for better processing
-        favorite_meals_str = ", ".join(req.favorite_menu)
-        todays_meals_str = ", ".join(req.todays_menu)
+        # Skip the LLM round trip when the answer is obvious
+        recommendation = _trivial_recommendation(req.favorite_menu, req.todays_menu)
+        if recommendation is None:
+            recommendation = await _recommend_cached(req.favorite_menu, req.todays_menu)
         
-        # TODO Use LangChain to generate recommendation
-        recommendation = recommendation_chain.invoke({"favorite_menu": favorite_meals_str, "todays_menu": todays_meals_str})
-        
-        # Return the LLM response as the recommendation
         return RecommendResponse(recommendation=recommendation)
         
     except HTTPException:
@@ -210,19 +525,19 @@ async def recommend(req: RecommendRequest) -> RecommendResponse:
         )
 
 
-@app.get("/")
-async def root():
+@app.get("/", response_model=ServiceInfoResponse)
+async def root() -> ServiceInfoResponse:
     """Root endpoint with service information."""
-    return {
-        "service": "LLM Recommendation Service",
-        "version": "1.0.0",
-        "description": "Generates personalized food recommendations using LangChain and Open WebUI",
-        "endpoints": {
+    return ServiceInfoResponse(
+        service="LLM Recommendation Service",
+        version="1.0.0",
+        description="Generates personalized food recommendations using LangChain and Open WebUI",
+        endpoints={
             "health": "/health",
             "recommend": "/recommend",
             "docs": "/docs"
         }
-    }
+    )
 
 # Entry point for direct execution
 if __name__ == "__main__":
@@ -232,6 +547,8 @@ if __name__ == "__main__":
 
     Honors PORT environment variable (default: 5000).
     Reload=True enables live-reload during development.
+    loop="auto" runs the app on uvloop where it is installed (not on Windows) and
+    falls back to the default asyncio loop otherwise.
     """
     import uvicorn
 
@@ -244,5 +561,6 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=True
+        reload=True,
+        loop="auto"
     )
@@ -0,0 +1,210 @@
+"""
+Open WebUI LLM client for the recommendation service.
+
+Kept separate from ``main`` so that LangChain, which is heavy to import, is only
+loaded on the first LLM call instead of at service startup.
+"""
+import os
+import json
+import asyncio
+import functools
+import httpx
+from typing import Dict, Any, ClassVar, List, Optional
+from langchain.llms.base import LLM
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+
+# orjson decodes the (often multi-KB) API responses noticeably faster; fall back to
+# the standard library if it is not installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# Environment configuration
+CHAIR_API_KEY = os.getenv("CHAIR_API_KEY")
+API_URL = "https://gpu.aet.cit.tum.de/api/chat/completions"
+# Upper bound on concurrent async calls to the LLM API, independent of request handling.
+# With HTTP/2 many calls share one connection, so this is enforced by a semaphore
+# rather than by the connection pool limits.
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", 64))
+
+
+# Shared by the sync and async clients. HTTP/2 lets concurrent calls multiplex over
+# one TCP/TLS connection instead of opening one connection per in-flight call.
+_HTTP_TIMEOUT = 30.0
+_HTTP_LIMITS = httpx.Limits(max_connections=LLM_WORKERS, max_keepalive_connections=32)
+
+
+def _build_client() -> httpx.Client:
+    """Create an HTTP/2 client that keeps connections to the LLM API alive."""
+    return httpx.Client(http2=True, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS)
+
+
+# Chat completion bodies are assembled from raw JSON bytes: the model and system
+# message are fixed, so only the user prompt needs to be escaped per request
+_JSON_BODY_SUFFIX = b'"}]}'
+
+
+@functools.lru_cache(maxsize=16)
+def _json_body_prefix(model_name: str, system_prompt: Optional[str]) -> bytes:
+    """Encode everything in the request body that precedes the user prompt."""
+    messages = f'{{"role":"system","content":{json.dumps(system_prompt)}}},' if system_prompt else ""
+    return f'{{"model":{json.dumps(model_name)},"messages":[{messages}{{"role":"user","content":"'.encode()
+
+
+class OpenWebUILLM(LLM):
+    """
+    Custom LangChain LLM wrapper for Open WebUI API.
+    
+    This class integrates the Open WebUI API with LangChain's LLM interface,
+    allowing us to use the API in LangChain chains and pipelines.
+    """
+    
+    api_url: str = API_URL
+    api_key: str = CHAIR_API_KEY
+    model_name: str = "llama3.3:latest"
+
+    # Shared across calls so the TCP/TLS connection to the API is reused
+    _client: ClassVar[httpx.Client] = _build_client()
+    # Used by the async path; opened on first use, closed by ``aclose``
+    _async_client: ClassVar[Optional[httpx.AsyncClient]] = None
+    # Caps in-flight async calls at LLM_WORKERS; created and reset with ``_async_client``
+    _async_slots: ClassVar[Optional[asyncio.Semaphore]] = None
+    
+    @property
+    def _llm_type(self) -> str:
+        return "open_webui"
+    
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """
+        Call the Open WebUI API to generate a response.
+        
+        Args:
+            prompt: The input prompt to send to the model
+            stop: Optional list of stop sequences
+            run_manager: Optional callback manager for LangChain
+            **kwargs: Additional keyword arguments; ``system_prompt`` is
+                sent as a leading system message
+            
+        Returns:
+            The generated response text
+            
+        Raises:
+            Exception: If API call fails
+        """
+        headers = self._headers
+
+        try:
+            response = self._client.post(
+                self.api_url,
+                headers=headers,
+                content=self._build_body(prompt, kwargs.get("system_prompt")),
+            )
+            response.raise_for_status()
+            return self._extract_content(json_loads(response.content))
+                
+        except httpx.HTTPError as e:
+            raise Exception(f"API request failed: {str(e)}")
+        except (KeyError, IndexError, ValueError) as e:
+            raise Exception(f"Failed to parse API response: {str(e)}")
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """
+        Asynchronously call the Open WebUI API to generate a response.
+
+        Uses the shared ``httpx.AsyncClient`` so the event loop is not
+        blocked for the duration of the round trip. At most ``LLM_WORKERS``
+        calls are in flight at once; further calls wait for a free slot.
+
+        Args:
+            prompt: The input prompt to send to the model
+            stop: Optional list of stop sequences
+            run_manager: Optional async callback manager for LangChain
+            **kwargs: Additional keyword arguments; ``system_prompt`` is
+                sent as a leading system message
+
+        Returns:
+            The generated response text
+
+        Raises:
+            Exception: If API call fails
+        """
+        client = type(self)._get_async_client()
+        headers = self._headers
+
+        try:
+            async with type(self)._async_slots:
+                response = await client.post(
+                    self.api_url,
+                    headers=headers,
+                    content=self._build_body(prompt, kwargs.get("system_prompt")),
+                )
+            response.raise_for_status()
+            return self._extract_content(json_loads(response.content))
+
+        except httpx.HTTPError as e:
+            raise Exception(f"API request failed: {str(e)}")
+        except (KeyError, IndexError, ValueError) as e:
+            raise Exception(f"Failed to parse API response: {str(e)}")
+
+    @classmethod
+    def _get_async_client(cls) -> httpx.AsyncClient:
+        """Return the shared async HTTP client, creating it and its call slots on first use."""
+        if cls._async_client is None:
+            cls._async_client = httpx.AsyncClient(http2=True, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS)
+            cls._async_slots = asyncio.Semaphore(LLM_WORKERS)
+        return cls._async_client
+
+    @classmethod
+    async def aclose(cls) -> None:
+        """Close the shared async HTTP client, if it was opened."""
+        if cls._async_client is not None:
+            await cls._async_client.aclose()
+            cls._async_client = None
+            cls._async_slots = None
+
+    @functools.cached_property
+    def _headers(self) -> Dict[str, str]:
+        """Request headers, built once per instance; fails early if no API key is set."""
+        if not self.api_key:
+            raise ValueError("CHAIR_API_KEY environment variable is required")
+        
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _build_body(self, prompt: str, system_prompt: Optional[str] = None) -> bytes:
+        """
+        Build the JSON chat completion body for a user prompt and optional system prompt.
+
+        Only the prompt is encoded per call; the rest of the body comes from a
+        memoized prefix, see ``_json_body_prefix``.
+        """
+        # json.dumps escapes the prompt (ASCII-only by default); drop its outer quotes
+        escaped_prompt = json.dumps(prompt)[1:-1].encode()
+        return _json_body_prefix(self.model_name, system_prompt) + escaped_prompt + _JSON_BODY_SUFFIX
+
+    @staticmethod
+    def _extract_content(result: Dict[str, Any]) -> str:
+        """Extract the generated text from a chat completion response."""
+        if "choices" in result and len(result["choices"]) > 0:
+            content = result["choices"][0]["message"]["content"]
+            return content.strip()
+        else:
+            raise ValueError("Unexpected response format from API")
@@ -0,0 +1,203 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from open_webui_llm import OpenWebUILLM
+
+MENUS = [["Salad", "Pasta"], ["Salad", "3-Käse-Pizza"]]
+
+
+def stub_llm(monkeypatch, batch_answer, single_answer="Salad"):
+    """Stub OpenWebUILLM._acall and record which kind of prompt each call was."""
+    calls = []
+
+    async def fake_acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        if kwargs.get("system_prompt") == main.BATCH_INSTRUCTIONS:
+            calls.append("batch")
+            if isinstance(batch_answer, Exception):
+                raise batch_answer
+            return batch_answer
+        calls.append("single")
+        return single_answer
+
+    monkeypatch.setattr(OpenWebUILLM, "_acall", fake_acall)
+    return calls
+
+
+def recommend_all(menus):
+    """Submit one request per menu concurrently through a fresh batcher."""
+    async def run():
+        batcher = main.RecommendationBatcher(max_batch=16, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(["Burger"], menu) for menu in menus))
+        finally:
+            await batcher.stop()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("answer", [
+    "Pasta\n3-Käse-Pizza",
+    "1. Pasta\n2. 3-Käse-Pizza",
+    "User 1: Pasta\n\nUser 2: 3-Käse-Pizza\n",
+])
+def test_batch_answer_is_split_per_user(monkeypatch, answer):
+    calls = stub_llm(monkeypatch, answer)
+
+    assert recommend_all(MENUS) == ["Pasta", "3-Käse-Pizza"]
+    assert calls == ["batch"]
+
+
+def test_batch_line_not_on_menu_falls_back_for_that_user(monkeypatch):
+    calls = stub_llm(monkeypatch, "Pasta\nPasta")
+
+    assert recommend_all(MENUS) == ["Pasta", "Salad"]
+    assert calls == ["batch", "single"]
+
+
+def test_wrong_line_count_falls_back_to_single_prompts(monkeypatch):
+    calls = stub_llm(monkeypatch, "Pasta")
+
+    assert recommend_all(MENUS) == ["Salad", "Salad"]
+    assert calls == ["batch", "single", "single"]
+
+
+def test_failed_batch_call_falls_back_to_single_prompts(monkeypatch):
+    calls = stub_llm(monkeypatch, Exception("API request failed"))
+
+    assert recommend_all(MENUS) == ["Salad", "Salad"]
+    assert calls == ["batch", "single", "single"]
+
+
+def test_requests_in_different_size_bins_are_not_batched(monkeypatch):
+    calls = stub_llm(monkeypatch, "Salad\nSalad")
+    small = ["Salad", "Pasta"]
+    large = ["Salad"] + [f"Dish {i}" for i in range(29)]
+
+    assert recommend_all([small, large]) == ["Salad", "Salad"]
+    assert calls == ["single", "single"]
+
+
+@pytest.mark.parametrize("size, bin_index", [(5, 0), (6, 1), (20, 1), (21, 2)])
+def test_size_bin_boundaries(size, bin_index):
+    async def queue_sizes():
+        batcher = main.RecommendationBatcher()
+        # Queues without collectors, so the request stays where submit put it
+        batcher._queues = [asyncio.Queue() for _ in range(len(batcher.size_bins) + 1)]
+        request = asyncio.create_task(batcher.submit(["Burger"], [f"Dish {i}" for i in range(size - 1)]))
+        await asyncio.sleep(0)
+        request.cancel()
+        return [queue.qsize() for queue in batcher._queues]
+
+    assert asyncio.run(queue_sizes()) == [int(i == bin_index) for i in range(3)]
+
+
+def test_submit_before_start_raises():
+    batcher = main.RecommendationBatcher()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.submit(["Burger"], ["Salad"]))
+
+
+def test_stop_dispatches_requests_still_being_collected(monkeypatch):
+    calls = stub_llm(monkeypatch, "Pasta\n3-Käse-Pizza")
+
+    async def run():
+        batcher = main.RecommendationBatcher(max_batch=16, max_wait_ms=60_000)
+        batcher.start()
+        requests = [asyncio.create_task(batcher.submit(["Burger"], menu)) for menu in MENUS]
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        return await asyncio.gather(*requests)
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=5)) == ["Pasta", "3-Käse-Pizza"]
+    assert calls == ["batch"]
+
+
+def test_find_menu_item_prefers_longest_contained_name():
+    assert main._find_menu_item("Pasta Carbonara.", ["Pasta", "Pasta Carbonara"]) == "Pasta Carbonara"
+    assert main._find_menu_item("Burger", ["Pasta"]) is None
+
+
+def test_concurrent_cache_misses_share_one_llm_call(monkeypatch):
+    calls = stub_llm(monkeypatch, "Salad")
+    main._recommendation_cache.clear()
+
+    async def run():
+        main.recommendation_batcher.start()
+        try:
+            return await asyncio.gather(
+                main._recommend_cached(["Burger"], ["Salad", "Pasta"]),
+                main._recommend_cached(["burger "], ["Pasta", "Salad"]),
+            )
+        finally:
+            await main.recommendation_batcher.stop()
+
+    assert asyncio.run(run()) == ["Salad", "Salad"]
+    assert calls == ["single"]
+    assert not main._pending_recommendations
+    main._recommendation_cache.clear()
+
+
+def test_menus_are_compared_ignoring_case_and_whitespace():
+    assert main._trivial_recommendation([" Pasta"], ["Salad", "pasta "]) == "pasta "
+    assert main._cache_key([" Pasta", "SALAD"]) == main._cache_key(["salad", "pasta"])
+    assert main._find_menu_item(" PASTA ", ["Salad", "Pasta"]) == "Pasta"
+
+
+@pytest.mark.parametrize("system_prompt", [None, 'Answer "briefly".\nNo ümlauts\\ please 🍝'])
+def test_request_body_is_valid_json(system_prompt):
+    llm = OpenWebUILLM(api_key="key")
+    prompt = 'User\'s "favorite" meals:\n\tKäsespätzle, Crème brûlée\\n 🍕'
+
+    body = json.loads(llm._build_body(prompt, system_prompt))
+
+    expected = [{"role": "user", "content": prompt}]
+    if system_prompt is not None:
+        expected.insert(0, {"role": "system", "content": system_prompt})
+    assert body == {"model": llm.model_name, "messages": expected}
+
+
+def test_trivial_recommendation_for_a_single_meal():
+    assert main._trivial_recommendation(["Burger"], ["Pasta"]) == "Pasta"
+
+
+def test_trivial_recommendation_matches_favorites_in_any_case():
+    assert main._trivial_recommendation(["PASTA"], ["Salad", "Pasta"]) == "Pasta"
+    assert main._trivial_recommendation(["Burger"], ["Salad", "Pasta"]) is None
+
+
+@pytest.fixture
+def client():
+    main._recommendation_cache.clear()
+    with TestClient(main.app) as client:
+        yield client
+    main._recommendation_cache.clear()
+
+
+def test_recommend_cache_hit_skips_the_llm(monkeypatch, client):
+    calls = stub_llm(monkeypatch, None, single_answer="Salad.")
+    request = {"favorite_menu": ["Burger"], "todays_menu": ["Salad", "Pasta"]}
+
+    first = client.post("/recommend", json=request)
+    second = client.post("/recommend", json={"favorite_menu": ["burger"], "todays_menu": ["Pasta", "Salad"]})
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json() == {"recommendation": "Salad"}
+    assert calls == ["single"]
+
+
+def test_recommend_answer_not_on_menu_falls_back_uncached(monkeypatch, client):
+    calls = stub_llm(monkeypatch, None, single_answer="Burger")
+    request = {"favorite_menu": ["Steak"], "todays_menu": ["Salad", "Pasta"]}
+
+    first = client.post("/recommend", json=request)
+    second = client.post("/recommend", json=request)
+
+    assert first.json() == second.json() == {"recommendation": "Salad"}
+    assert calls == ["single", "single"]
+    assert len(main._recommendation_cache) == 0